@@ -1,22 +1,44 @@
+import atexit
+import contextlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-import json
-from markitdown import MarkItDown
+import re
+import html
+import orjson
+import ijson
+import itertools
+import io
+from markitdown import MarkItDown, StreamInfo
 from wakepy import keep
-from bs4 import XMLParsedAsHTMLWarning, Tag
+from bs4 import XMLParsedAsHTMLWarning, NavigableString, Tag
 import warnings
+from lxml import etree
 import duckdb
 import logging
-from logging.handlers import RotatingFileHandler
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from dotenv import load_dotenv
 from tqdm import tqdm
 
 from utils import get_standard_timestamp
-from upsert_to_db import upsert_to_db, batch_upsert_to_db
+from upsert_to_db import bulk_upsert_to_db
 
 warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 md = MarkItDown(enable_plugins=False)
 
+# HTML wrapper and stream info used when converting DIV fragments to markdown
+HTML_DOCUMENT_TEMPLATE = "<!DOCTYPE html><html><head><title>CFR Content</title></head><body>{body}</body></html>"
+HTML_STREAM_INFO = StreamInfo(mimetype="text/html", extension=".html", charset="utf-8")
+
+# Numbered DIV tags (DIV1, DIV5, DIV8, ...) and the elements excluded from a DIV's own text
+DIV_TAG_RE = re.compile(r'^DIV(\d+)$', re.IGNORECASE)
+EXCLUDED_TAGS = frozenset({'HEAD', 'SECAUTH', 'CITA'})
+
 # Load environment variables
 load_dotenv()
 
@@ -25,9 +47,30 @@ DOWNLOAD_DIR = "data"
 
 # Local DuckDB configuration
 LOCAL_DB_PATH = os.path.join(DOWNLOAD_DIR, "ecfr_data.duckdb")
+DUCKDB_THREADS = os.getenv("ECFR_DUCKDB_THREADS")  # Unset: DuckDB's default (one per core)
+
+# Concurrent download configuration
+MAX_DOWNLOAD_WORKERS = 10  # Structure JSON + full XML for each of the default titles
+MAX_PARSE_WORKERS = min(len(TITLE_NUMBERS), os.cpu_count() or 1)  # Processes parsing full XML (ECFR_WRITE_DIV_ELEMENTS only)
+
+# HTTP configuration
+REQUEST_TIMEOUT = 60  # Seconds to wait for the eCFR API before giving up
+XML_CHUNK_SIZE = 1024 * 1024  # 1MB chunks when streaming full XML to disk
+JSON_DUMP_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS  # Pretty UTF-8 output for reference JSON files
+
+# Optional reference artifacts; nothing downstream reads them back, so they are off by default
+WRITE_RAW_STRUCTURE = os.getenv("ECFR_WRITE_RAW_STRUCTURE") == "1"  # ecfr_title-N-structure.json
+WRITE_DIV_ELEMENTS = os.getenv("ECFR_WRITE_DIV_ELEMENTS") == "1"  # ecfr_title-N-div-elements.json
+SHOW_PARSE_PROGRESS = True  # XML parse progress bars; turned off in parse worker processes
 
-# Batch processing configuration
-BATCH_SIZE = 100  # Number of records to process in each batch
+# Shared session so connections and TLS state to ecfr.gov are reused across requests;
+# the fetch functions take it as their session argument
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+))
 
 # Configure logging with rotating file handler and console handler
 logger = logging.getLogger(__name__)
@@ -39,7 +82,8 @@ file_handler = RotatingFileHandler(
     'logs/download_ecfr_titles.log', 
     maxBytes=10*1024*1024,  # 10MB
     backupCount=2,          # Keep 2 backup files (total ~30MB max)
-    encoding='utf-8'
+    encoding='utf-8',
+    delay=True              # Parse workers re-import this module; only the first write opens the file
 )
 file_handler.setLevel(logging.INFO)
 # Create console handler - ERROR level  
@@ -53,21 +97,85 @@ console_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
+def _route_logger_to_queue(log_queue):
+    """Replace the logger's handlers with a QueueHandler on log_queue and return the removed handlers."""
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    queue_handler = QueueHandler(log_queue)
+    # Drop records no handler would emit before QueueHandler.prepare() formats them
+    queue_handler.setLevel(min(handler.level for handler in handlers))
+    logger.addHandler(queue_handler)
+    return handlers
+
+def start_queued_logging():
+    """
+    Move the logger's handlers behind a queue so logging calls don't block on I/O.
+    
+    Records are written by a listener thread instead of the thread that logs them,
+    so file writes and console output don't stall the download and write loop.
+    Parse worker processes forward their records to this process (see start_parse_pool).
+    
+    Returns:
+        QueueListener: Started listener; call stop() to flush remaining records
+    """
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *_route_logger_to_queue(log_queue), respect_handler_level=True)
+    listener.start()
+    return listener
+
+def init_parse_worker(log_queue):
+    """
+    Set up an XML parse worker process (ProcessPoolExecutor initializer).
+    
+    The worker re-imports this module, which attaches the file and console handlers
+    again. They are swapped for a QueueHandler on log_queue so only the main process
+    writes and rotates the log file, and progress bars are turned off so they don't
+    draw over the main process's bars.
+    
+    Args:
+        log_queue (multiprocessing.Queue): Queue drained by the main process's worker log listener
+    """
+    global SHOW_PARSE_PROGRESS
+    SHOW_PARSE_PROGRESS = False
+    for handler in _route_logger_to_queue(log_queue):
+        handler.close()
+
+def _load_schema_statements(schema_sql_path=os.path.join("docs", "ecfr_data_model.sql")):
+    """
+    Read the SQL schema file and split it into individual statements.
+    
+    Args:
+        schema_sql_path (str): Path to the schema file
+        
+    Returns:
+        list: Non-empty SQL statements, or an empty list if the file is missing
+    """
+    if not os.path.exists(schema_sql_path):
+        return []
+    with open(schema_sql_path, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    # Split on semicolons while preserving statements (simple split sufficient here)
+    return [stmt.strip() for stmt in schema_sql.split(';') if stmt.strip()]
+
+# Schema statements are read once; they only run when a new database file is created
+_SCHEMA_STMTS = _load_schema_statements()
+
 def get_local_connection():
     """Get (and initialize if needed) a connection to the local DuckDB database."""
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
     initializing = not os.path.exists(LOCAL_DB_PATH)
     try:
         conn = duckdb.connect(LOCAL_DB_PATH)
+        # One-shot ingestion: nothing depends on the order rows are loaded in, so let
+        # DuckDB parallelize inserts without preserving it
+        conn.execute("SET preserve_insertion_order = false")
+        if DUCKDB_THREADS:
+            conn.execute(f"SET threads = {int(DUCKDB_THREADS)}")
         if initializing:
             logger.info(f"Created new local DuckDB database at {LOCAL_DB_PATH}")
-        # Ensure required tables exist using the SQL schema file if present
-        schema_sql_path = os.path.join("docs", "ecfr_data_model.sql")
-        if os.path.exists(schema_sql_path):
-            with open(schema_sql_path, 'r', encoding='utf-8') as f:
-                schema_sql = f.read()
-            # Split on semicolons while preserving statements (simple split sufficient here)
-            for stmt in [s.strip() for s in schema_sql.split(';') if s.strip()]:
+            # Create required tables using the SQL schema file if present
+            for stmt in _SCHEMA_STMTS:
                 try:
                     conn.execute(stmt)
                 except Exception as stmt_e:
@@ -80,35 +188,36 @@ def get_local_connection():
 
 
 # --- API & METADATA LOGIC ---
-def get_titles_metadata():
+def get_titles_metadata(session=SESSION):
     url = "https://www.ecfr.gov/api/versioner/v1/titles"
-    response = requests.get(url)
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     titles = response.json()["titles"]
     filtered_titles = [title for title in titles if title["number"] in TITLE_NUMBERS]
     return filtered_titles
 
-def get_titles_metadata_and_write_to_db(conn):
+def get_titles_metadata_and_write_to_db(conn, session=SESSION):
     try:
         url = "https://www.ecfr.gov/api/versioner/v1/titles"
         logger.info(f"Fetching titles metadata from {url}")
-        response = requests.get(url)
+        response = session.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         titles = response.json()["titles"]
         filtered_titles = [title for title in titles if title["number"] in TITLE_NUMBERS]
         logger.info(f"Filtered to {len(filtered_titles)} relevant titles: {[t['number'] for t in filtered_titles]}")
         
+        # Fetch existing download dates in one query to preserve title_details_download_date
+        existing_rows = conn.execute(
+            "SELECT title_number, title_details_download_date FROM titles WHERE title_number = ANY(?)",
+            [TITLE_NUMBERS]
+        ).fetchall()
+        existing_download_dates = dict(existing_rows)
+
         # Prepare records for batch processing
         title_records = []
-        for title in tqdm(filtered_titles, desc="Processing titles metadata", unit="title"):
-            # First check if title already exists to preserve title_details_download_date
-            existing_result = conn.execute(
-                "SELECT title_details_download_date FROM titles WHERE title_number = ?",
-                [title["number"]]
-            ).fetchone()
-            
-            existing_download_date = existing_result[0] if existing_result else None
-            
+        for title in tqdm(filtered_titles, desc="Processing titles metadata", unit="title", mininterval=0.5):
+            existing_download_date = existing_download_dates.get(title["number"])
+
             record = {
                 "title_number": title["number"],
                 "title_label": title.get("name"),
@@ -120,21 +229,12 @@ def get_titles_metadata_and_write_to_db(conn):
             title_records.append(record)
             logger.debug(f"Prepared record for title {title['number']}: {title.get('name')}")
         
-        # Batch upsert all title records
+        # Stage all title records (sorted by key for DuckDB's index path) and upsert them
+        # in one INSERT ... ON CONFLICT statement
         if title_records:
-            try:
-                records_processed = batch_upsert_to_db(conn, title_records, 'titles', 
-                                                     conflict_key='title_number', batch_size=BATCH_SIZE)
-                logger.info(f"Successfully batch upserted {records_processed} title records")
-            except Exception as e:
-                logger.warning(f"Batch upsert failed, falling back to individual inserts: {e}")
-                # Fallback to individual processing
-                for record in title_records:
-                    try:
-                        upsert_to_db(conn, record, "titles", "title_number")
-                        logger.debug(f"Individual upsert successful for title {record['title_number']}")
-                    except Exception as individual_error:
-                        logger.error(f"Individual upsert failed for title {record['title_number']}: {individual_error}")
+            title_records.sort(key=lambda r: r["title_number"])
+            records_processed = bulk_upsert_to_db(conn, title_records, 'titles', conflict_key='title_number')
+            logger.info(f"Successfully bulk upserted {records_processed} title records")
         
         return filtered_titles
     except Exception as e:
@@ -193,7 +293,217 @@ def should_download_title_details(conn, title_obj):
         # Default to downloading on error
         return True
 
-def get_parts_and_structure(title_obj, download_dir, conn):
+def fetch_title_structure(title_obj, download_dir, session=SESSION):
+    """
+    Fetch the structure JSON for a title from the eCFR API and flatten it.
+    
+    The response is stream-parsed straight into flattened records, so the full
+    structure tree is never held in memory. When ECFR_WRITE_RAW_STRUCTURE is set,
+    the response is saved to disk first and flattened from that file.
+    
+    Args:
+        title_obj (dict): Title metadata object
+        download_dir (str): Directory to save downloaded files
+        session (requests.Session): Session to fetch with (default: shared SESSION)
+        
+    Returns:
+        list: Flattened structure elements (see flatten_structure_stream)
+    """
+    title_number = title_obj['number']
+    up_to_date_as_of = title_obj['up_to_date_as_of']
+    structure_url = f"https://www.ecfr.gov/api/versioner/v1/structure/{up_to_date_as_of}/title-{title_number}.json"
+    logger.info(f"Fetching structure from {structure_url}")
+    with session.get(structure_url, stream=True, timeout=REQUEST_TIMEOUT) as structure_response:
+        structure_response.raise_for_status()
+        if not WRITE_RAW_STRUCTURE:
+            # Let urllib3 undo any gzip/deflate transfer encoding before ijson reads the stream
+            structure_response.raw.decode_content = True
+            return flatten_structure_stream(structure_response.raw)
+        
+        # Save the structure JSON as served for reference
+        structure_file = f"{download_dir}/ecfr_title-{title_number}-structure.json"
+        with open(structure_file, 'wb') as f:
+            for chunk in structure_response.iter_content(chunk_size=XML_CHUNK_SIZE):
+                f.write(chunk)
+    with open(structure_file, 'rb') as f:
+        return flatten_structure_stream(f)
+
+def download_title_xml(title_obj, download_dir, session=SESSION):
+    """
+    Download the full XML text for a title from the eCFR API and save it to disk.
+    
+    Args:
+        title_obj (dict): Title metadata object
+        download_dir (str): Directory to save downloaded files
+        session (requests.Session): Session to fetch with (default: shared SESSION)
+        
+    Returns:
+        str: Path to the saved XML file
+    """
+    title_number = title_obj['number']
+    up_to_date_as_of = title_obj['up_to_date_as_of']
+    full_url = f"https://www.ecfr.gov/api/versioner/v1/full/{up_to_date_as_of}/title-{title_number}.xml"
+    logger.info(f"Downloading full XML from: {full_url}")
+    
+    xml_file_path = f"{download_dir}/ecfr_title-{title_number}-full.xml"
+    # Stream straight to disk so large titles are never held in memory as a string
+    with session.get(full_url, stream=True, timeout=REQUEST_TIMEOUT) as xml_response:
+        xml_response.raise_for_status()
+        with open(xml_file_path, 'wb') as f:
+            for chunk in xml_response.iter_content(chunk_size=XML_CHUNK_SIZE):
+                f.write(chunk)
+    logger.info(f"Downloaded XML file for Title {title_number}")
+    return xml_file_path
+
+def download_and_parse_title_xml(title_obj, download_dir, parse_executor=None, session=SESSION):
+    """
+    Download the full XML for a title and parse its numbered DIV elements.
+    
+    Args:
+        title_obj (dict): Title metadata object
+        download_dir (str): Directory to save downloaded files
+        parse_executor (ProcessPoolExecutor, optional): Pool to parse the XML in, so
+            titles are parsed in parallel outside the GIL. Parsed inline if not provided.
+        session (requests.Session): Session to fetch with (default: shared SESSION)
+        
+    Returns:
+        list: Parsed DIV elements (see parse_xml_divs_with_numbers)
+    """
+    xml_file_path = download_title_xml(title_obj, download_dir, session)
+    if parse_executor is None:
+        return parse_xml_divs_with_numbers(xml_file_path)
+    return parse_executor.submit(parse_xml_divs_with_numbers, xml_file_path).result()
+
+def get_parse_mp_context():
+    """
+    Get the multiprocessing context the XML parse workers are started with.
+    
+    Uses a fork server where the platform has one and spawn otherwise (e.g. Windows).
+    Plain fork is avoided: forking this process while download threads hold locks
+    (logging, SSL) can deadlock the child.
+    
+    Returns:
+        multiprocessing.context.BaseContext: Context for the ProcessPoolExecutor
+    """
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(start_method)
+
+def start_parse_pool(log_listener):
+    """
+    Create the process pool parsing full XML, with worker logs sent to this process.
+    
+    Workers put their records on a multiprocessing queue drained by a second listener
+    using log_listener's handlers. It is stopped at exit, before log_listener.
+    
+    Args:
+        log_listener (QueueListener): Main listener from start_queued_logging
+        
+    Returns:
+        ProcessPoolExecutor: Pool whose workers are set up by init_parse_worker
+    """
+    mp_context = get_parse_mp_context()
+    worker_log_queue = mp_context.Queue()
+    worker_log_listener = QueueListener(worker_log_queue, *log_listener.handlers, respect_handler_level=True)
+    worker_log_listener.start()
+    atexit.register(worker_log_listener.stop)
+    return ProcessPoolExecutor(max_workers=MAX_PARSE_WORKERS, mp_context=mp_context,
+                               initializer=init_parse_worker, initargs=(worker_log_queue,))
+
+def start_title_downloads(title_obj, download_dir, executor, parse_executor=None, session=SESSION):
+    """
+    Submit the structure JSON and full XML downloads for a title to an executor.
+    
+    Both requests run concurrently with each other and with downloads for other
+    titles, so network latency overlaps with parsing and DB writes done on the
+    calling thread.
+    
+    Args:
+        title_obj (dict): Title metadata object
+        download_dir (str): Directory to save downloaded files
+        executor (ThreadPoolExecutor): Executor running the downloads
+        parse_executor (ProcessPoolExecutor, optional): Pool parsing the full XML
+        session (requests.Session): Session shared by both downloads (default: shared SESSION)
+        
+    Returns:
+        tuple: (structure_future, div_elements_future). Unless ECFR_WRITE_DIV_ELEMENTS
+            is set, the XML is only downloaded and the second future yields its path.
+    """
+    structure_future = executor.submit(fetch_title_structure, title_obj, download_dir, session)
+    if WRITE_DIV_ELEMENTS:
+        div_elements_future = executor.submit(download_and_parse_title_xml, title_obj, download_dir,
+                                              parse_executor, session)
+    else:
+        # The parsed DIVs only feed the div-elements file, so skip parsing when it is off
+        div_elements_future = executor.submit(download_title_xml, title_obj, download_dir, session)
+    return structure_future, div_elements_future
+
+def notify_when_downloaded(title_number, downloads, ready_titles):
+    """
+    Put a title number on a queue once all of its download futures have finished.
+    
+    Lets the single database writer process titles in the order their downloads
+    complete instead of waiting on them in title order.
+    
+    Args:
+        title_number (int): Title the downloads belong to
+        downloads (tuple): Futures returned by start_title_downloads
+        ready_titles (queue.Queue): Queue the title number is put on
+    """
+    remaining = [len(downloads)]
+    lock = threading.Lock()
+    
+    def on_done(_future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                ready_titles.put(title_number)
+    
+    for future in downloads:
+        future.add_done_callback(on_done)
+
+def write_title_details(conn, pending_details):
+    """
+    Upsert the detail records of one or more titles and mark them downloaded.
+    
+    All records are staged together and written with a single upsert statement;
+    the records and download dates are committed in one transaction.
+    
+    Args:
+        conn: Database connection object
+        pending_details (list): (title_number, detail_records) tuples
+    """
+    if not pending_details:
+        return
+    
+    title_numbers = [title_number for title_number, _ in pending_details]
+    # Upserting in key order keeps DuckDB's primary key index updates local;
+    # unsorted upsert batches degrade sharply as the table grows
+    detail_records = sorted(
+        (record for _, records in pending_details for record in records),
+        key=lambda r: r["cfr_ref"]
+    )
+    
+    conn.begin()
+    try:
+        if detail_records:
+            successful_inserts = bulk_upsert_to_db(conn, detail_records, 'title_details',
+                                                   conflict_key='cfr_ref', auto_commit=False)
+            logger.info(f"Successfully bulk upserted {successful_inserts} title detail records for Titles {title_numbers}")
+        
+        # Update title_details_download_date in titles table
+        conn.execute(
+            "UPDATE titles SET title_details_download_date = ? WHERE title_number = ANY(?)",
+            [get_standard_timestamp(), title_numbers]
+        )
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Rolling back database writes for Titles {title_numbers}: {e}")
+        conn.rollback()
+        raise
+    
+    logger.info(f"Updated title_details_download_date for Titles {title_numbers}")
+
+def get_parts_and_structure(title_obj, download_dir, conn, downloads=None, pending_details=None, session=SESSION):
     """
     Download and process eCFR title structure and optionally full text.
     
@@ -201,53 +511,48 @@ def get_parts_and_structure(title_obj, download_dir, conn):
         title_obj (dict): Title metadata object
         download_dir (str): Directory to save downloaded files
         conn: Database connection object
+        downloads (tuple, optional): (structure_future, div_elements_future) from
+            start_title_downloads. Downloads are started here if not provided.
+        pending_details (list, optional): If given, (title_number, detail_records) is
+            appended for a later write_title_details call instead of writing now.
+        session (requests.Session): Session used when downloads are started here
+            (default: shared SESSION)
     """
+    if downloads is None:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            return get_parts_and_structure(
+                title_obj, download_dir, conn,
+                start_title_downloads(title_obj, download_dir, executor, session=session),
+                pending_details
+            )
+    
+    structure_future, div_elements_future = downloads
     try:
         title_number = title_obj['number']
-        up_to_date_as_of = title_obj['up_to_date_as_of']
         
-        # Structure JSON
-        structure_url = f"https://www.ecfr.gov/api/versioner/v1/structure/{up_to_date_as_of}/title-{title_number}.json"
-        logger.info(f"Fetching structure from {structure_url}")
-        structure_response = requests.get(structure_url)
-        structure_response.raise_for_status()
-        structure_json = structure_response.json()
-        
-        # Save pretty JSON for reference
-        structure_file = f"{download_dir}/ecfr_title-{title_number}-structure.json"
-        with open(structure_file, "w", encoding="utf-8") as f:
-            json.dump(structure_json, f, indent=2, ensure_ascii=False)
+        # Structure JSON, flattened with improved CFR reference calculation as it downloads
+        flattened = structure_future.result()
         logger.info(f"Downloaded structure for Title {title_number}")
         
-        # Flatten the structure with improved CFR reference calculation
-        flattened = flatten_all_elements_with_full_hierarchy(structure_json)
         flattened_file = f"{download_dir}/ecfr_title-{title_number}-structure-flat.json"
-        with open(flattened_file, "w", encoding="utf-8") as f:
-            json.dump(flattened, f, indent=2, ensure_ascii=False)
+        with open(flattened_file, "wb") as f:
+            f.write(orjson.dumps(flattened, option=JSON_DUMP_OPTIONS))
         logger.info(f"Extracted {len(flattened)} elements with full hierarchy context and hierarchy level.")
 
-        # Download full XML text (currently commented out as it's not processed)
-        full_url = f"https://www.ecfr.gov/api/versioner/v1/full/{up_to_date_as_of}/title-{title_number}.xml"
-        logger.info(f"Downloading full XML from: {full_url}")
-        
-        # Download and save XML file
-        xml_file_path = f"{download_dir}/ecfr_title-{title_number}-full.xml"
+        # Numbered DIV elements from the full XML (downloaded and parsed concurrently)
         try:
-            xml_response = requests.get(full_url)
-            xml_response.raise_for_status()
-            with open(xml_file_path, 'w', encoding='utf-8') as f:
-                f.write(xml_response.text)
-            logger.info(f"Downloaded XML file for Title {title_number}")
-            
-            # Parse the XML for numbered DIV elements
-            div_elements = parse_xml_divs_with_numbers(xml_file_path)
-            logger.info(f"Parsed {len(div_elements)} numbered DIV elements from XML")
-            
-            # Save parsed DIV data as JSON for reference
-            div_file_path = f"{download_dir}/ecfr_title-{title_number}-div-elements.json"
-            with open(div_file_path, 'w', encoding='utf-8') as f:
-                json.dump(div_elements, f, indent=2, ensure_ascii=False)
-            logger.info(f"Saved parsed DIV elements to {div_file_path}")
+            if WRITE_DIV_ELEMENTS:
+                div_elements = div_elements_future.result()
+                logger.info(f"Parsed {len(div_elements)} numbered DIV elements from XML")
+                
+                # Save parsed DIV data as JSON for reference
+                div_file_path = f"{download_dir}/ecfr_title-{title_number}-div-elements.json"
+                with open(div_file_path, 'wb') as f:
+                    f.write(orjson.dumps(div_elements, option=JSON_DUMP_OPTIONS))
+                logger.info(f"Saved parsed DIV elements to {div_file_path}")
+            else:
+                # Only downloaded; wait for it so download errors are still reported
+                div_elements_future.result()
             
         except requests.RequestException as e:
             logger.error(f"Error downloading XML for Title {title_number}: {e}")
@@ -267,7 +572,8 @@ def get_parts_and_structure(title_obj, download_dir, conn):
         skipped_records = 0
         
         # Process database insertions with progress bar
-        for item in tqdm(filtered_flattened, desc=f"Preparing Title {title_number} records", unit="record", leave=False):
+        for item in tqdm(filtered_flattened, desc=f"Preparing Title {title_number} records", unit="record", leave=False,
+                         mininterval=0.5):
             try:
                 # Map fields to DB schema with validation
                 record = {
@@ -308,38 +614,26 @@ def get_parts_and_structure(title_obj, download_dir, conn):
                 logger.error(f"Error preparing record for {item.get('cfr_ref', 'unknown')}: {e}")
                 continue
         
-        # Batch upsert detail records
-        successful_inserts = 0
-        if detail_records:
-            try:
-                records_processed = batch_upsert_to_db(conn, detail_records, 'title_details', 
-                                                     conflict_key='cfr_ref', batch_size=BATCH_SIZE)
-                successful_inserts = records_processed
-                logger.info(f"Successfully batch upserted {records_processed} title detail records for Title {title_number}")
-            except Exception as e:
-                logger.warning(f"Batch upsert failed for Title {title_number}, falling back to individual inserts: {e}")
-                # Fallback to individual processing
-                for record in detail_records:
-                    try:
-                        upsert_to_db(conn, record, "title_details", "cfr_ref")
-                        successful_inserts += 1
-                    except Exception as individual_error:
-                        logger.error(f"Individual upsert failed for {record.get('cfr_ref', 'unknown')}: {individual_error}")
+        # Keep one record per cfr_ref (last wins) so the upsert never sees duplicate conflict keys
+        records_by_cfr_ref = {}
+        for record in detail_records:
+            if record["cfr_ref"] in records_by_cfr_ref:
+                logger.warning(f"Duplicate cfr_ref {record['cfr_ref']} in Title {title_number}; keeping the later record")
+                skipped_records += 1
+            records_by_cfr_ref[record["cfr_ref"]] = record
         
-        logger.info(f"Successfully processed {successful_inserts}/{len(filtered_flattened)} title detail records for Title {title_number} (skipped {skipped_records})")
+        detail_records = list(records_by_cfr_ref.values())
+        logger.info(f"Prepared {len(detail_records)}/{len(filtered_flattened)} title detail records for Title {title_number} (skipped {skipped_records})")
         
-        # Update title_details_download_date in titles table
-        conn.execute(
-            "UPDATE titles SET title_details_download_date = ? WHERE title_number = ?",
-            [get_standard_timestamp(), title_number]
-        )
-        conn.commit()
-        logger.info(f"Updated title_details_download_date for Title {title_number}")
+        if pending_details is not None:
+            pending_details.append((title_number, detail_records))
+        else:
+            write_title_details(conn, [(title_number, detail_records)])
         
     except requests.RequestException as e:
         logger.error(f"Network error processing Title {title_obj.get('number', 'unknown')}: {e}")
         raise
-    except json.JSONDecodeError as e:
+    except ijson.JSONError as e:
         logger.error(f"JSON parsing error for Title {title_obj.get('number', 'unknown')}: {e}")
         raise
     except Exception as e:
@@ -350,6 +644,9 @@ def parse_xml_divs_with_numbers(xml_file_path):
     """
     Parse XML file and extract DIV elements with numbers in their tag names.
     
+    Streams the document with lxml.etree.iterparse; falls back to BeautifulSoup
+    if lxml rejects the document as malformed.
+    
     Args:
         xml_file_path (str): Path to the XML file to parse
         
@@ -357,154 +654,301 @@ def parse_xml_divs_with_numbers(xml_file_path):
         list: List of dictionaries containing div information with:
             - div_tag: The complete div tag name (e.g., 'DIV1', 'DIV2', etc.)
             - div_number: The number extracted from the div tag
-            - text_content: Text content between the div tags (stripped of whitespace)
+            - text_content: Text content of the div. DIVs without nested numbered DIVs use
+              their plain text; others are converted to markdown without the nested DIVs
             - All XML attributes are flattened to the top level
     """
     try:
-        import re
-        from bs4 import BeautifulSoup
-        
         logger.info(f"Parsing XML file: {xml_file_path}")
         
-        with open(xml_file_path, 'r', encoding='utf-8') as file:
-            xml_content = file.read()
-        
-        # Parse XML with BeautifulSoup
-        soup = BeautifulSoup(xml_content, 'xml')
-        
-        # Find all DIV elements that have numbers in their tag names
-        div_pattern = re.compile(r'^DIV\d+$', re.IGNORECASE)
-        numbered_divs = soup.find_all(div_pattern)
-        
-        result = []
+        try:
+            result = _parse_xml_divs_with_lxml(xml_file_path)
+        except etree.XMLSyntaxError as e:
+            logger.warning(f"lxml could not parse {xml_file_path} ({e}), falling back to BeautifulSoup")
+            result = _parse_xml_divs_with_bs4(xml_file_path)
+            
+        logger.info(f"Extracted {len(result)} numbered DIV elements from XML")
+        return result
         
-        for div in tqdm(numbered_divs, desc="Processing numbered DIV elements", unit="div", leave=False):
-            # Extract the number from the DIV tag
-            div_tag = getattr(div, "name", None)
-            if div_tag:
-                div_tag = div_tag.upper()
-            else:
-                div_tag = ""
-            div_number_match = re.search(r'DIV(\d+)', div_tag, re.IGNORECASE)
-            div_number = int(div_number_match.group(1)) if div_number_match else None
+    except FileNotFoundError:
+        logger.error(f"XML file not found: {xml_file_path}")
+        return []
+    except Exception as e:
+        logger.error(f"Error parsing XML file {xml_file_path}: {e}")
+        return []
+
+def _parse_xml_divs_with_lxml(xml_file_path):
+    """
+    Extract numbered DIV elements from an XML file using lxml.etree.iterparse.
+    
+    Results are returned in document order (the same order as a pre-order walk).
+    A numbered DIV nested directly in another is cleared once processed; its parent
+    only reads its own non-DIV children plus the first HEAD/SECAUTH/CITA text, which
+    is tracked as the document is read. An outermost numbered DIV and everything
+    before it is freed once processed.
+    """
+    result = []
+    # [result index, has nested numbered DIVs, {tag: text of its first HEAD/SECAUTH/CITA},
+    # only numbered DIVs between it and the outermost open DIV] for numbered DIVs that
+    # have started but not ended
+    open_divs = []
+    
+    with open(xml_file_path, 'rb') as file, \
+            tqdm(desc="Processing numbered DIV elements", unit="div", leave=False, mininterval=0.5,
+                 disable=not SHOW_PARSE_PROGRESS) as progress:
+        for event, elem in etree.iterparse(file, events=("start", "end"), remove_comments=True,
+                                           remove_pis=True, huge_tree=True):
+            if not DIV_TAG_RE.match(elem.tag):
+                tag = elem.tag
+                if tag in EXCLUDED_TAGS and open_divs:
+                    # The first one (by start) belongs to every open DIV that hasn't seen one yet:
+                    # the innermost open DIVs, since an outer DIV has seen all an inner one has.
+                    # Hold the element until it ends, then swap in its text.
+                    content = elem if event == "start" else None
+                    for open_div in reversed(open_divs):
+                        if event == "start":
+                            if tag in open_div[2]:
+                                break
+                        elif open_div[2].get(tag) is elem:
+                            if content is None:
+                                content = _join_stripped(elem.itertext())
+                        else:
+                            break
+                        open_div[2][tag] = content
+                continue
             
-            # Get direct text content (excluding nested tags)
-            text_content = ""
-            head_content = ""
-            secauth_content = ""
-            cita_content = ""
+            if event == "start":
+                # A DIV reached through any other element is serialized whole by an ancestor
+                only_div_ancestors = not open_divs or (
+                    open_divs[-1][3] and DIV_TAG_RE.match(elem.getparent().tag) is not None
+                )
+                if open_divs:
+                    open_divs[-1][1] = True
+                # Reserve the slot now so nested DIVs (which end first) keep document order
+                open_divs.append([len(result), False, {}, only_div_ancestors])
+                result.append(None)
+                continue
             
-            # Extract HEAD element content separately
-            if isinstance(div, Tag):
-                head_elements = div.find_all('HEAD')
-                if head_elements:
-                    head_content = head_elements[0].get_text(strip=True)
-                
-                # Extract SECAUTH element content separately
-                secauth_elements = div.find_all('SECAUTH')
-                if secauth_elements:
-                    secauth_content = secauth_elements[0].get_text(strip=True)
-                
-                # Extract CITA element content separately
-                cita_elements = div.find_all('CITA')
-                if cita_elements:
-                    cita_content = cita_elements[0].get_text(strip=True)
+            slot, has_nested_divs, special_contents, only_div_ancestors = open_divs.pop()
+            result[slot] = _extract_lxml_div_info(elem, has_nested_divs, special_contents)
+            progress.update(1)
             
-            text_content_candidate = div.get_text(strip=True)
-            if text_content_candidate:
-                text_content = text_content_candidate
-            else:
-                # Get all content excluding nested DIV elements with numbers and special elements
-                excluded_elements = {'HEAD', 'SECAUTH', 'CITA'}
-                
-                # Create a copy of the div for processing
-                import copy
-                temp_div = copy.deepcopy(div)
-                
-                # Remove excluded elements and nested numbered DIVs
-                elements_to_remove = []
-                if isinstance(temp_div, Tag):
-                    for element in temp_div.find_all():
-                        element_name = getattr(element, "name", None)
-                        if (element_name and 
-                            (div_pattern.match(element_name) or 
-                             element_name.upper() in excluded_elements)):
-                            elements_to_remove.append(element)
-                
-                for element in elements_to_remove:
-                    element.decompose()
-                
-                # Convert the cleaned XML/HTML to markdown
-                try:
-                    # Get the inner HTML content (without the outer DIV tag)
-                    # Safely get inner content depending on the type of temp_div
-                    if isinstance(temp_div, Tag) and hasattr(temp_div, 'contents') and isinstance(temp_div.contents, list):
-                        inner_content = ''.join(str(child) for child in temp_div.contents)
-                    elif isinstance(temp_div, Tag) and hasattr(temp_div, 'string') and temp_div.string is not None:
-                        inner_content = temp_div.string
-                    else:
-                        inner_content = ''
-                    
-                    if inner_content.strip():
-                        # Create a temporary file for MarkItDown to process
-                        import tempfile
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as temp_file:
-                            # Write proper HTML structure
-                            temp_file.write(f"<!DOCTYPE html><html><head><title>CFR Content</title></head><body>{inner_content}</body></html>")
-                            temp_file_path = temp_file.name
-                        
-                        try:
-                            logger.debug(f"Converting temp file to markdown for {div_tag}: {temp_file_path}")
-                            markdown_result = md.convert(temp_file_path)
-                            if markdown_result and markdown_result.text_content:
-                                text_content = markdown_result.text_content.strip()
-                                logger.debug(f"Markdown result for {div_tag}: {text_content[:200]}...")
-                            else:
-                                # Fallback to plain text extraction
-                                text_content = temp_div.get_text(separator=' ', strip=True)
-                        finally:
-                            # Clean up temp file
-                            try:
-                                os.unlink(temp_file_path)
-                            except Exception:
-                                pass
-                    else:
-                        text_content = ""
-                        
-                except Exception as e:
-                    logger.warning(f"Could not convert to markdown for div {div_tag}: {e}")
+            if not open_divs:
+                # Free completed top-level DIVs and everything before them
+                elem.clear(keep_tail=True)
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            elif only_div_ancestors:
+                # Open ancestors skip numbered DIV children (keeping only their tail) and
+                # already have their HEAD/SECAUTH/CITA text, so drop the processed subtree.
+                # DIVs inside other elements are kept: an ancestor serializes those whole.
+                elem.clear(keep_tail=True)
+    
+    return result
+
+def _extract_lxml_div_info(div, has_nested_divs, special_contents):
+    """
+    Build the div info dictionary for a fully parsed lxml numbered DIV element.
+    
+    Args:
+        div: The numbered DIV element (nested numbered DIVs may already be cleared)
+        has_nested_divs (bool): Whether the DIV contains numbered DIV descendants
+        special_contents (dict): Text of the first HEAD, SECAUTH and CITA descendant,
+            keyed by tag (missing if the DIV has none)
+    """
+    div_tag = div.tag.upper()
+    div_number_match = DIV_TAG_RE.match(div_tag)
+    div_number = int(div_number_match.group(1)) if div_number_match else None
+    
+    # HEAD, SECAUTH and CITA element content separately (first descendant of each)
+    head_content = special_contents.get('HEAD', "")
+    secauth_content = special_contents.get('SECAUTH', "")
+    cita_content = special_contents.get('CITA', "")
+    
+    if not has_nested_divs:
+        # Without nested numbered DIVs all of the text is this DIV's own; no markdown needed
+        text_content = _join_stripped(div.itertext(), separator=' ')
+    else:
+        # Get all content excluding nested DIV elements with numbers and special elements,
+        # in a single pass over the children rather than copying and pruning the tree
+        html_parts = [html.escape(div.text, quote=False)] if div.text else []
+        text_parts = [div.text] if div.text else []
+        for child in div:
+            if DIV_TAG_RE.match(child.tag) or child.tag.upper() in EXCLUDED_TAGS:
+                # Skip the element but keep any text that follows it
+                if child.tail:
+                    html_parts.append(html.escape(child.tail, quote=False))
+                    text_parts.append(child.tail)
+                continue
+            html_parts.append(etree.tostring(child, encoding='unicode'))  # includes tail
+            text_parts.extend(child.itertext())
+            if child.tail:
+                text_parts.append(child.tail)
+        
+        # Convert the cleaned XML/HTML to markdown
+        try:
+            # Inner HTML content (without the outer DIV tag)
+            inner_content = ''.join(html_parts)
+            
+            if inner_content.strip():
+                text_content = _convert_html_to_markdown(inner_content, div_tag)
+                if text_content is None:
                     # Fallback to plain text extraction
-                    text_content = temp_div.get_text(separator=' ', strip=True)
+                    text_content = _join_stripped(text_parts, separator=' ')
+            else:
+                text_content = ""
                 
-                # Clean up any remaining extra whitespace
-                if text_content:
-                    text_content = ' '.join(text_content.split()).strip()
+        except Exception as e:
+            logger.warning(f"Could not convert to markdown for div {div_tag}: {e}")
+            # Fallback to plain text extraction
+            text_content = _join_stripped(text_parts, separator=' ')
+        
+        # Clean up any remaining extra whitespace
+        if text_content:
+            text_content = ' '.join(text_content.split()).strip()
+    
+    # Start with basic div info
+    div_info = {
+        'div_tag': div_tag,
+        'div_number': div_number,
+        'text_content': text_content,
+        'head_content': head_content,
+        'secauth_content': secauth_content,
+        'cita_content': cita_content
+    }
+    
+    # Flatten all XML attributes to the top level
+    div_info.update(div.attrib)
+    
+    return div_info
+
+def _join_stripped(strings, separator=''):
+    """Strip each string, drop empty ones and join the rest (like BeautifulSoup's get_text(strip=True))."""
+    return separator.join(stripped for stripped in (s.strip() for s in strings) if stripped)
+
+def _convert_html_to_markdown(inner_content, div_tag):
+    """
+    Convert an HTML fragment to markdown with MarkItDown, entirely in memory.
+    
+    Returns:
+        str or None: Stripped markdown text, or None if MarkItDown produced nothing
+    """
+    html_bytes = HTML_DOCUMENT_TEMPLATE.format(body=inner_content).encode('utf-8')
+    logger.debug(f"Converting HTML to markdown for {div_tag}")
+    markdown_result = md.convert_stream(io.BytesIO(html_bytes), stream_info=HTML_STREAM_INFO)
+    if markdown_result and markdown_result.text_content:
+        text_content = markdown_result.text_content.strip()
+        logger.debug(f"Markdown result for {div_tag}: {text_content[:200]}...")
+        return text_content
+    return None
+
+def _parse_xml_divs_with_bs4(xml_file_path):
+    """Extract numbered DIV elements from an XML file using BeautifulSoup (fallback parser)."""
+    from bs4 import BeautifulSoup
+    
+    with open(xml_file_path, 'r', encoding='utf-8') as file:
+        xml_content = file.read()
+    
+    # Parse XML with BeautifulSoup
+    soup = BeautifulSoup(xml_content, 'xml')
+    
+    # Find all DIV elements that have numbers in their tag names
+    numbered_divs = soup.find_all(DIV_TAG_RE)
+    
+    result = []
+    
+    for div in tqdm(numbered_divs, desc="Processing numbered DIV elements", unit="div", leave=False,
+                    mininterval=0.5, disable=not SHOW_PARSE_PROGRESS):
+        # Extract the number from the DIV tag
+        div_tag = getattr(div, "name", None)
+        if div_tag:
+            div_tag = div_tag.upper()
+        else:
+            div_tag = ""
+        div_number_match = DIV_TAG_RE.match(div_tag)
+        div_number = int(div_number_match.group(1)) if div_number_match else None
+        
+        # Get direct text content (excluding nested tags)
+        text_content = ""
+        head_content = ""
+        secauth_content = ""
+        cita_content = ""
+        
+        # Extract HEAD element content separately
+        if isinstance(div, Tag):
+            head_elements = div.find_all('HEAD')
+            if head_elements:
+                head_content = head_elements[0].get_text(strip=True)
             
-            # Start with basic div info
-            div_info = {
-                'div_tag': div_tag,
-                'div_number': div_number,
-                'text_content': text_content,
-                'head_content': head_content,
-                'secauth_content': secauth_content,
-                'cita_content': cita_content
-            }
+            # Extract SECAUTH element content separately
+            secauth_elements = div.find_all('SECAUTH')
+            if secauth_elements:
+                secauth_content = secauth_elements[0].get_text(strip=True)
             
-            # Flatten all XML attributes to the top level
-            if isinstance(div, Tag) and div.attrs:
-                div_info.update(dict(div.attrs))
+            # Extract CITA element content separately
+            cita_elements = div.find_all('CITA')
+            if cita_elements:
+                cita_content = cita_elements[0].get_text(strip=True)
+        
+        if not div.find(DIV_TAG_RE):
+            # Without nested numbered DIVs all of the text is this DIV's own; no markdown needed
+            text_content = div.get_text(separator=' ', strip=True)
+        else:
+            # Get all content excluding nested DIV elements with numbers and special elements,
+            # in a single pass over the children rather than copying and decomposing the tree
+            own_contents = [
+                child for child in div.contents
+                if not (isinstance(child, Tag) and
+                        (DIV_TAG_RE.match(child.name) or child.name.upper() in EXCLUDED_TAGS))
+            ]
             
-            result.append(div_info)
+            # Convert the cleaned XML/HTML to markdown
+            try:
+                # Inner HTML content (without the outer DIV tag)
+                inner_content = ''.join(str(child) for child in own_contents)
+                
+                if inner_content.strip():
+                    text_content = _convert_html_to_markdown(inner_content, div_tag)
+                    if text_content is None:
+                        # Fallback to plain text extraction
+                        text_content = _get_bs4_contents_text(own_contents)
+                else:
+                    text_content = ""
+                    
+            except Exception as e:
+                logger.warning(f"Could not convert to markdown for div {div_tag}: {e}")
+                # Fallback to plain text extraction
+                text_content = _get_bs4_contents_text(own_contents)
             
-        logger.info(f"Extracted {len(result)} numbered DIV elements from XML")
-        return result
+            # Clean up any remaining extra whitespace
+            if text_content:
+                text_content = ' '.join(text_content.split()).strip()
         
-    except FileNotFoundError:
-        logger.error(f"XML file not found: {xml_file_path}")
-        return []
-    except Exception as e:
-        logger.error(f"Error parsing XML file {xml_file_path}: {e}")
-        return []
+        # Start with basic div info
+        div_info = {
+            'div_tag': div_tag,
+            'div_number': div_number,
+            'text_content': text_content,
+            'head_content': head_content,
+            'secauth_content': secauth_content,
+            'cita_content': cita_content
+        }
+        
+        # Flatten all XML attributes to the top level
+        if isinstance(div, Tag) and div.attrs:
+            div_info.update(dict(div.attrs))
+        
+        result.append(div_info)
+    
+    return result
+
+def _get_bs4_contents_text(contents):
+    """Plain text of a list of BeautifulSoup nodes, like get_text(separator=' ', strip=True)."""
+    return _join_stripped(
+        (string for node in contents for string in
+         (node.strings if isinstance(node, Tag) else [node] if type(node) is NavigableString else [])),
+        separator=' '
+    )
 
 def calculate_cfr_ref(item):
     """
@@ -524,145 +968,265 @@ def calculate_cfr_ref(item):
         return f"CFR {hierarchy_type}"
     
     base_ref = f"{title_id} CFR"
+    return _CFR_REF_BUILDERS.get(hierarchy_type, _build_unknown_ref)(item, base_ref)
+
+def _build_title_ref(item, base_ref):
+    return base_ref
+
+def _build_chapter_ref(item, base_ref):
+    chapter_id = item.get("chapter_identifier", "")
+    return f"{base_ref} ch{chapter_id}" if chapter_id else base_ref
+
+def _build_subchapter_ref(item, base_ref):
+    chapter_id = item.get("chapter_identifier", "")
+    subchapter_id = item.get("subchapter_identifier", "")
+    if chapter_id and subchapter_id:
+        return f"{base_ref} ch{chapter_id}-{subchapter_id}"
+    return base_ref
+
+def _build_part_ref(item, base_ref):
+    part_id = item.get("part_identifier", "")
+    return f"{base_ref} pt{part_id}" if part_id else base_ref
+
+def _build_subpart_ref(item, base_ref):
+    part_id = item.get("part_identifier", "")
+    subpart_id = item.get("subpart_identifier", "")
+    if part_id and subpart_id:
+        return f"{base_ref} pt{part_id}-{subpart_id}"
+    return base_ref
+
+def _build_section_ref(item, base_ref):
+    section_id = item.get("section_identifier", "")
+    return f"{base_ref} §{section_id}" if section_id else base_ref
+
+def _build_appendix_ref(item, base_ref):
+    # Handle appendix attached to section or part
+    appendix_id = item.get("appendix_identifier", "")
+    if item.get("section_identifier"):
+        base = f"{base_ref} §{item['section_identifier']}"
+    elif item.get("part_identifier"):
+        base = f"{base_ref} pt{item['part_identifier']}"
+    else:
+        base = base_ref
+    return f"{base} ( {appendix_id})" if appendix_id else base
+
+def _build_subject_group_ref(item, base_ref):
+    subj_grp_id = item.get("subject_group_identifier", "")
+    subj_grp_suffix = f" (Subj Grp {subj_grp_id})" if subj_grp_id else ""
     
-    if hierarchy_type == "title":
-        return base_ref
-    elif hierarchy_type == "chapter":
-        chapter_id = item.get("chapter_identifier", "")
-        return f"{base_ref} ch{chapter_id}" if chapter_id else base_ref
-    elif hierarchy_type == "subchapter":
-        chapter_id = item.get("chapter_identifier", "")
-        subchapter_id = item.get("subchapter_identifier", "")
-        if chapter_id and subchapter_id:
-            return f"{base_ref} ch{chapter_id}-{subchapter_id}"
-        return base_ref
-    elif hierarchy_type == "part":
-        part_id = item.get("part_identifier", "")
-        return f"{base_ref} pt{part_id}" if part_id else base_ref
-    elif hierarchy_type == "subpart":
-        part_id = item.get("part_identifier", "")
-        subpart_id = item.get("subpart_identifier", "")
-        if part_id and subpart_id:
-            return f"{base_ref} pt{part_id}-{subpart_id}"
-        return base_ref
-    elif hierarchy_type == "section":
+    # Build base reference for subject group context
+    if item.get("appendix_identifier"):
         section_id = item.get("section_identifier", "")
-        return f"{base_ref} §{section_id}" if section_id else base_ref
-    elif hierarchy_type == "appendix":
-        # Handle appendix attached to section or part
-        if "section_identifier" in item and item["section_identifier"]:
-            section_id = item["section_identifier"]
-            appendix_id = item.get("appendix_identifier", "")
-            return f"{base_ref} §{section_id} ( {appendix_id})" if appendix_id else f"{base_ref} §{section_id}"
-        elif "part_identifier" in item and item["part_identifier"]:
-            part_id = item["part_identifier"]
-            appendix_id = item.get("appendix_identifier", "")
-            return f"{base_ref} pt{part_id} ( {appendix_id})" if appendix_id else f"{base_ref} pt{part_id}"
-        else:
-            appendix_id = item.get("appendix_identifier", "")
-            return f"{base_ref} ( {appendix_id})" if appendix_id else base_ref
-    elif hierarchy_type == "subject_group":
-        subj_grp_id = item.get("subject_group_identifier", "")
-        subj_grp_suffix = f" (Subj Grp {subj_grp_id})" if subj_grp_id else ""
-        
-        # Build base reference for subject group context
-        if "appendix_identifier" in item and item["appendix_identifier"]:
-            section_id = item.get("section_identifier", "")
-            appendix_id = item["appendix_identifier"]
-            base = f"{base_ref} §{section_id} ( {appendix_id})" if section_id else f"{base_ref} ( {appendix_id})"
-        elif "section_identifier" in item and item["section_identifier"]:
-            section_id = item["section_identifier"]
-            base = f"{base_ref} §{section_id}"
-        elif "subpart_identifier" in item and item["subpart_identifier"]:
-            part_id = item.get("part_identifier", "")
-            subpart_id = item["subpart_identifier"]
-            base = f"{base_ref} pt{part_id}-{subpart_id}" if part_id else f"{base_ref} (Subpart {subpart_id})"
-        elif "part_identifier" in item and item["part_identifier"]:
-            part_id = item["part_identifier"]
-            base = f"{base_ref} pt{part_id}"
-        elif "subchapter_identifier" in item and item["subchapter_identifier"]:
-            chapter_id = item.get("chapter_identifier", "")
-            subchapter_id = item["subchapter_identifier"]
-            base = f"{base_ref} ch{chapter_id}-{subchapter_id}" if chapter_id else f"{base_ref} (Subchapter {subchapter_id})"
-        else:
-            base = base_ref
-            
-        return f"{base}{subj_grp_suffix}"
+        appendix_id = item["appendix_identifier"]
+        base = f"{base_ref} §{section_id} ( {appendix_id})" if section_id else f"{base_ref} ( {appendix_id})"
+    elif item.get("section_identifier"):
+        section_id = item["section_identifier"]
+        base = f"{base_ref} §{section_id}"
+    elif item.get("subpart_identifier"):
+        part_id = item.get("part_identifier", "")
+        subpart_id = item["subpart_identifier"]
+        base = f"{base_ref} pt{part_id}-{subpart_id}" if part_id else f"{base_ref} (Subpart {subpart_id})"
+    elif item.get("part_identifier"):
+        part_id = item["part_identifier"]
+        base = f"{base_ref} pt{part_id}"
+    elif item.get("subchapter_identifier"):
+        chapter_id = item.get("chapter_identifier", "")
+        subchapter_id = item["subchapter_identifier"]
+        base = f"{base_ref} ch{chapter_id}-{subchapter_id}" if chapter_id else f"{base_ref} (Subchapter {subchapter_id})"
     else:
-        logger.warning(f"Unknown hierarchy_type: {hierarchy_type}")
-        return f"{base_ref} ({hierarchy_type})"
+        base = base_ref
+        
+    return f"{base}{subj_grp_suffix}"
+
+def _build_unknown_ref(item, base_ref):
+    hierarchy_type = item.get("hierarchy_type")
+    logger.warning(f"Unknown hierarchy_type: {hierarchy_type}")
+    return f"{base_ref} ({hierarchy_type})"
+
+# CFR reference builder for each hierarchy_type
+_CFR_REF_BUILDERS = {
+    "title": _build_title_ref,
+    "chapter": _build_chapter_ref,
+    "subchapter": _build_subchapter_ref,
+    "part": _build_part_ref,
+    "subpart": _build_subpart_ref,
+    "section": _build_section_ref,
+    "appendix": _build_appendix_ref,
+    "subject_group": _build_subject_group_ref,
+}
 
 
 # --- FLATTENING LOGIC (improved) ---
-def flatten_all_elements_with_full_hierarchy(node, results=None, parent_chain=None, level=0, order_id=[1]):
-    if results is None:
-        results = []
-    if parent_chain is None:
-        parent_chain = []
-
-    # Remove unwanted keys from the current node
-    remove_list = ["size", "volumes", "descendant_range"]
-    for key in remove_list:
-        if key in node:
-            del node[key]
-
-    # Build a combined dict of all parent fields up the hierarchy
-    combined_parent_fields = {}
-    for ancestor in parent_chain:
-        for k, v in ancestor.items():
-            if k != "children":
-                prefix = ancestor.get("type", "root")
-                combined_parent_fields[f"{prefix}_{k}"] = v
-
-    # Add current node's fields (without children)
-    element = {}
-    for k, v in node.items():
-        if k not in ["children", "type"]:
-            prefix = node.get("type", "root")
-            element[f"{prefix}_{k}"] = v
-    
-    # Merge in all parent fields up the hierarchy
-    element.update(combined_parent_fields)
-    
-    # Add hierarchy metadata
-    element["hierarchy_level"] = level
-    element["hierarchy_type"] = node.get("type")
-    element["order_id"] = order_id[0]
-    order_id[0] += 1
-    
-    # Calculate if this is a leaf node (has no children)
-    element["is_leaf_node"] = len(node.get("children", [])) == 0
+# Structure node keys that are not carried into flattened elements
+EXCLUDED_STRUCTURE_KEYS = frozenset({"size", "volumes", "descendant_range"})
+
+def _prefix_node_items(node, include_type=True):
+    """Return a structure node's own fields as (key, value) pairs, keys prefixed by its type."""
+    prefix = node.get("type", "root")
+    return tuple((f"{prefix}_{k}", v) for k, v in node.items() if include_type or k != "type")
+
+def _build_flat_element(node, inherited_items, level, order_id, is_leaf_node):
+    """
+    Build the flattened element for one structure node.
+    
+    Args:
+        node (dict): The node's own fields, excluding children and EXCLUDED_STRUCTURE_KEYS
+        inherited_items (tuple): Type-prefixed (key, value) pairs of all ancestors, outermost
+            first; later pairs win on repeated keys
+        level (int): Depth of the node in the tree (root is 0)
+        order_id (int): Document-order position of the node
+        is_leaf_node (bool): Whether the node has no children
+        
+    Returns:
+        dict: Element with prefixed fields, ancestor fields and hierarchy metadata
+    """
+    # Own fields first, then all parent fields up the hierarchy, then hierarchy metadata,
+    # materialized in a single dict construction
+    element = dict(itertools.chain(
+        _prefix_node_items(node, include_type=False),
+        inherited_items,
+        (
+            ("hierarchy_level", level),
+            ("hierarchy_type", node.get("type")),
+            ("order_id", order_id),
+            ("is_leaf_node", is_leaf_node),
+        ),
+    ))
     
     # Calculate CFR reference for this element
     element["cfr_ref"] = calculate_cfr_ref(element)
-    
-    results.append(element)
+    return element
 
-    # Recurse into children, passing down the full parent chain and incrementing level
-    for child in node.get("children", []):
-        flatten_all_elements_with_full_hierarchy(child, results, parent_chain + [node], level=level+1, order_id=order_id)
+def _read_json_value(events, event, value):
+    """Consume one JSON value from an ijson basic_parse stream, building containers."""
+    if event not in ("start_map", "start_array"):
+        return value
+    builder = ijson.ObjectBuilder()
+    builder.event(event, value)
+    depth = 1
+    for event, value in events:
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+            if depth == 0:
+                return builder.value
 
+def flatten_structure_stream(fp):
+    """
+    Stream-parse an eCFR structure JSON document into a flat list of elements.
+    
+    Elements are produced in depth-first (pre-order) document order. Each holds
+    its own fields and all ancestor fields, prefixed by the owning node's type
+    (e.g. "part_identifier"), plus hierarchy_level, hierarchy_type, order_id,
+    is_leaf_node and cfr_ref.
+    
+    Nodes' own fields are collected while parsing and the elements are built in a
+    second pass, so children inherit every field of their ancestors wherever the
+    "children" key appears in the object.
+    
+    Args:
+        fp: Binary file-like object containing the structure JSON (typically the title)
+        
+    Returns:
+        list: Flattened elements; order_id starts at 1 for each call
+    """
+    # Nodes in document order: [fields, parent index, level, has_children]
+    nodes = []
+    # Indexes of open nodes, innermost last
+    stack = []
+    events = ijson.basic_parse(fp, use_float=True)
+    
+    for event, value in events:
+        if event == "map_key":
+            fields = nodes[stack[-1]][0]
+            if value == "children":
+                event, value = next(events)
+                if event != "start_array":
+                    _read_json_value(events, event, value)
+            else:
+                field_value = _read_json_value(events, *next(events))
+                if value not in EXCLUDED_STRUCTURE_KEYS:
+                    fields[value] = field_value
+        elif event == "start_map":
+            # A new node: the root, or the next item of the open node's children array
+            if stack:
+                parent = nodes[stack[-1]]
+                parent[3] = True
+                parent_index, level = stack[-1], parent[2] + 1
+            else:
+                parent_index, level = None, 0
+            stack.append(len(nodes))
+            nodes.append([{}, parent_index, level, False])
+        elif event == "end_map":
+            stack.pop()
+    
+    results = []
+    # Type-prefixed items a node passes to its children: its ancestors' items, then its own
+    child_items = [None] * len(nodes)
+    for index, (fields, parent_index, level, has_children) in enumerate(nodes):
+        inherited_items = () if parent_index is None else child_items[parent_index]
+        if has_children:
+            child_items[index] = inherited_items + _prefix_node_items(fields)
+        results.append(_build_flat_element(fields, inherited_items, level, index + 1, not has_children))
+    
     return results
 
 if __name__ == "__main__":
+    # Stopping the listener at exit flushes queued records, including after an uncaught error
+    log_listener = start_queued_logging()
+    atexit.register(log_listener.stop)
     with keep.running():
         os.makedirs(DOWNLOAD_DIR, exist_ok=True)
         logger.info("Starting eCFR titles download process (local DuckDB mode)...")
         conn = get_local_connection()
         try:
-            titles_with_dates = get_titles_metadata_and_write_to_db(conn)
+            titles_with_dates = get_titles_metadata_and_write_to_db(conn, SESSION)
             logger.info(f"Retrieved metadata for {len(titles_with_dates)} titles")
-            for title in tqdm(titles_with_dates, desc="Processing eCFR titles", unit="title"):
-                download_dir = f"{DOWNLOAD_DIR}/ecfr_title-{title['number']}"
-                os.makedirs(download_dir, exist_ok=True)
-                if should_download_title_details(conn, title):
-                    logger.info(
-                        f"Title {title['number']}: {title['name']} (Up to date as of {title['up_to_date_as_of']}) Fetching parts and structure..."
-                    )
-                    get_parts_and_structure(title, download_dir, conn)
-                    logger.info(f"Successfully processed Title {title['number']}")
-                else:
-                    logger.info(f"Title {title['number']}: Skipping download - current data is up to date")
+            # The process pool is only needed to parse the XML for the div-elements files
+            parse_pool = start_parse_pool(log_listener) if WRITE_DIV_ELEMENTS else contextlib.nullcontext()
+            with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor, parse_pool as parse_executor:
+                try:
+                    # Start all downloads up front so they overlap with parsing below.
+                    # This thread is the only DB writer; it prepares titles as they come off
+                    # ready_titles and writes them all once the last one is done.
+                    title_downloads = {}
+                    ready_titles = queue.Queue()
+                    for title in titles_with_dates:
+                        download_dir = f"{DOWNLOAD_DIR}/ecfr_title-{title['number']}"
+                        os.makedirs(download_dir, exist_ok=True)
+                        if should_download_title_details(conn, title):
+                            title_downloads[title['number']] = start_title_downloads(
+                                title, download_dir, executor, parse_executor, SESSION
+                            )
+                            notify_when_downloaded(title['number'], title_downloads[title['number']], ready_titles)
+                        else:
+                            logger.info(f"Title {title['number']}: Skipping download - current data is up to date")
+                    
+                    titles_by_number = {title['number']: title for title in titles_with_dates}
+                    pending_details = []
+                    try:
+                        for _ in tqdm(range(len(title_downloads)), desc="Processing eCFR titles", unit="title",
+                                        mininterval=0.5):
+                            title = titles_by_number[ready_titles.get()]
+                            download_dir = f"{DOWNLOAD_DIR}/ecfr_title-{title['number']}"
+                            logger.info(
+                                f"Title {title['number']}: {title['name']} (Up to date as of {title['up_to_date_as_of']}) Fetching parts and structure..."
+                            )
+                            get_parts_and_structure(title, download_dir, conn, title_downloads[title['number']],
+                                                    pending_details)
+                            logger.info(f"Successfully processed Title {title['number']}")
+                    finally:
+                        # One staged upsert for every title's records instead of one per title.
+                        # Titles prepared before a failure are still written and marked downloaded.
+                        write_title_details(conn, pending_details)
+                except BaseException:
+                    # Don't wait on downloads or parsing that haven't started yet
+                    executor.shutdown(cancel_futures=True)
+                    if parse_executor is not None:
+                        parse_executor.shutdown(cancel_futures=True)
+                    raise
             logger.info("All titles processed and written to local DuckDB database.")
         finally:
             conn.close()
@@ -15,7 +15,20 @@ Example usage:
 
 import re
 import logging
-from typing import Union, Dict, Any, List, Tuple
+from functools import lru_cache
+from typing import Union, Dict, Any, List, Optional, Tuple
+
+# Optional: stage records as Arrow tables, which DuckDB scans without copying
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Optional: pandas staging fallback, imported once rather than on every batch
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
 
 # Module metadata
 __version__ = "1.0.0"
@@ -23,6 +36,10 @@ __author__ = "TTB Regulations Download Project"
 __all__ = [
     "upsert_to_db",
     "batch_upsert_to_db", 
+    "bulk_upsert_to_db",
+    "bulk_append",
+    "prepare_upsert",
+    "PreparedUpsert",
     "DatabaseError",
     "validate_sql_identifier",
     "clean_numeric_value",
@@ -33,9 +50,6 @@ __all__ = [
 # Module-level logger
 logger = logging.getLogger(__name__)
 
-# Compiled regex for SQL identifier validation (more efficient than recompiling)
-_VALID_SQL_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
-
 # Compiled regex for cleaning numeric strings
 _NUMERIC_CLEANER = re.compile(r'[,\s]')
 
@@ -79,6 +93,93 @@ def clean_record_values(record: Dict[str, Any]) -> Dict[str, Any]:
     return {key: clean_numeric_value(value) for key, value in record.items()}
 
 
+def _record_columns(records: List[Dict[str, Any]]) -> List[str]:
+    """Union of the records' keys, in first-seen order."""
+    return list(dict.fromkeys(key for record in records for key in record))
+
+
+def _stage_records(records: List[Dict[str, Any]], columns: Optional[List[str]] = None):
+    """
+    Build the object registered with DuckDB for a set of records.
+    
+    Uses a pyarrow Table when pyarrow is installed, falling back to a pandas
+    DataFrame otherwise or when a column mixes Python types Arrow cannot hold.
+    
+    Args:
+        records: List of dictionaries (missing keys become NULL)
+        columns: Columns to stage, in order (default: union of the records' keys)
+        
+    Returns:
+        Tuple of (pyarrow Table or pandas DataFrame, list of column names)
+    """
+    if columns is None:
+        columns = _record_columns(records)
+    if pa is not None:
+        try:
+            table = pa.table({col: pa.array([record.get(col) for record in records]) for col in columns})
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            if pd is None:
+                raise DatabaseError(f"Arrow could not type a column and pandas is not installed: {e}") from e
+            logger.debug(f"Staging records with pandas; Arrow could not type a column: {e}")
+        else:
+            return table, columns
+    
+    df = pd.DataFrame(records, columns=columns)
+    return df, columns
+
+
+def _numeric_column_types(conn, table_name: str) -> Dict[str, str]:
+    """
+    Look up the numeric columns of a table and their SQL types.
+    
+    Only the current database and schema are searched, where the unqualified
+    table name in the upsert statement resolves, so a same-named table in
+    another schema or attached catalog is not mixed in.
+    
+    Args:
+        conn: DuckDB connection object
+        table_name: Name of the (validated) target table
+        
+    Returns:
+        Dictionary mapping column name to SQL type, e.g. {"title_number": "INTEGER"}
+    """
+    numeric_columns_sql = """--sql
+    SELECT column_name, data_type
+    FROM duckdb_columns()
+    WHERE table_name = ? AND numeric_precision IS NOT NULL
+        AND schema_name = current_schema() AND database_name = current_database()
+    """
+    return dict(conn.execute(numeric_columns_sql, [table_name]).fetchall())
+
+
+def _clean_numeric_columns(record: Dict[str, Any], numeric_columns) -> Dict[str, Any]:
+    """Clean the values bound for numeric target columns; other values are kept as is."""
+    return {
+        key: clean_numeric_value(value) if key in numeric_columns else value
+        for key, value in record.items()
+    }
+
+
+def _numeric_string_casts(records: List[Dict[str, Any]], columns: List[str],
+                          numeric_types: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """
+    Pick the columns bound for numeric target columns that hold string values.
+    
+    Args:
+        records: List of dictionaries being staged
+        columns: Staged column names
+        numeric_types: Numeric target columns from _numeric_column_types()
+        
+    Returns:
+        Tuple of (column name, SQL type) pairs to clean and cast in SQL. The cast
+        goes through VARCHAR, so batches where a listed column holds numbers also work.
+    """
+    return tuple(
+        (col, numeric_types[col]) for col in columns
+        if col in numeric_types and any(isinstance(record.get(col), str) for record in records)
+    )
+
+
 class DatabaseError(Exception):
     """
     Custom exception for database operation errors.
@@ -109,16 +210,113 @@ def validate_sql_identifier(identifier: str, identifier_type: str = "identifier"
     if not isinstance(identifier, str):
         raise DatabaseError(f"Invalid {identifier_type}: must be a string, got {type(identifier).__name__}")
     
+    _check_identifier_string(identifier, identifier_type)
+
+
+@lru_cache(maxsize=1024)
+def _check_identifier_string(identifier: str, identifier_type: str) -> None:
+    """Check a string identifier; valid identifiers are cached so repeat checks are free."""
     if not identifier:
         raise DatabaseError(f"Invalid {identifier_type}: cannot be empty")
     
-    if not _VALID_SQL_IDENTIFIER.match(identifier):
+    # For ASCII strings isidentifier() is exactly [A-Za-z_][A-Za-z0-9_]*, without a regex
+    if not (identifier.isascii() and identifier.isidentifier()):
         raise DatabaseError(
             f"Invalid {identifier_type}: '{identifier}'. "
             "Must start with letter or underscore, contain only letters, numbers, and underscores."
         )
 
 
+def _normalize_conflict_keys(conflict_key: Union[str, List[str], Tuple[str, ...]]) -> Tuple[str, ...]:
+    """Normalize and validate conflict_key as a non-empty tuple of column names."""
+    if isinstance(conflict_key, str):
+        conflict_keys = (conflict_key,)
+    elif isinstance(conflict_key, (list, tuple)):
+        conflict_keys = tuple(conflict_key)
+    else:
+        raise ValueError(f"conflict_key must be string, list, or tuple, got {type(conflict_key)}")
+    
+    if not conflict_keys:
+        raise ValueError("conflict_key cannot be empty")
+    
+    for key in conflict_keys:
+        validate_sql_identifier(key, "conflict key")
+    return conflict_keys
+
+
+@lru_cache(maxsize=256)
+def _quote_cols(columns: Tuple[str, ...]) -> str:
+    """Comma-separated, double-quoted column list (cached per column tuple)."""
+    return ', '.join(f'"{col}"' for col in columns)
+
+
+@lru_cache(maxsize=64)
+def _quote_placeholders(count: int) -> str:
+    """Comma-separated list of count ? placeholders (cached per count)."""
+    return ', '.join(['?'] * count)
+
+
+@lru_cache(maxsize=256)
+def _build_upsert_sql(
+    table_name: str,
+    columns: Tuple[str, ...],
+    conflict_keys: Tuple[str, ...],
+    stage_view: Optional[str] = None,
+    numeric_casts: Tuple[Tuple[str, str], ...] = ()
+) -> str:
+    """
+    Build (and cache) an INSERT ... ON CONFLICT upsert statement.
+    
+    Args:
+        table_name: Name of the (validated) target table
+        columns: (Validated) column names being inserted, in value order
+        conflict_keys: (Validated) column names used for conflict resolution.
+                      Empty for a plain INSERT without conflict handling.
+        stage_view: Registered view to select rows from. If None, the statement
+                   takes one row of ? placeholders.
+        numeric_casts: (column, SQL type) pairs of staged columns whose commas and
+                      whitespace are stripped before casting (stage_view only)
+    
+    Returns:
+        SQL string updating every non-key column from the incoming row on conflict
+    """
+    column_list = _quote_cols(columns)
+    conflict_clause = _quote_cols(conflict_keys)
+    if stage_view is None:
+        source_sql = f"VALUES ({_quote_placeholders(len(columns))})"
+    else:
+        # Cleaning runs in DuckDB as one vectorized expression per numeric column
+        casts = dict(numeric_casts)
+        select_list = ', '.join(
+            f"CAST(regexp_replace(CAST(\"{col}\" AS VARCHAR), '{_NUMERIC_CLEANER.pattern}', '', 'g') AS {casts[col]})"
+            if col in casts else f'"{col}"'
+            for col in columns
+        )
+        source_sql = f'SELECT {select_list} FROM "{stage_view}"'
+    
+    if not conflict_keys:
+        return f"""
+        INSERT INTO "{table_name}" ({column_list}) 
+        {source_sql}
+    """
+    
+    # Create update clause (exclude conflict keys from updates)
+    update_columns = [col for col in columns if col not in conflict_keys]
+    if update_columns:
+        update_clause = ', '.join(f'"{col}" = excluded."{col}"' for col in update_columns)
+        conflict_action = f"DO UPDATE SET {update_clause}"
+    else:
+        # If all columns are conflict keys, just do INSERT ... ON CONFLICT DO NOTHING
+        conflict_action = "DO NOTHING"
+    
+    return f"""
+        INSERT INTO "{table_name}" ({column_list}) 
+        {source_sql}
+        ON CONFLICT({conflict_clause}) 
+        {conflict_action}
+    """
+
+
 def upsert_to_db(
     conn, 
     record: Dict[str, Any], 
@@ -126,7 +324,7 @@ def upsert_to_db(
     conflict_key: Union[str, List[str], Tuple[str, ...]] = 'id',
     clean_numeric_strings: bool = True,
     *,
-    auto_commit: bool = True
+    auto_commit: bool = False
 ) -> None:
     """
     Generic upsert function for DuckDB with comprehensive validation and error handling.
@@ -140,9 +338,13 @@ def upsert_to_db(
         table_name: Name of the target table
         conflict_key: Column name(s) to use for conflict resolution.
                      Can be a string for single column or list/tuple for multiple columns.
-        clean_numeric_strings: If True (default), automatically clean numeric strings
-                              by removing commas and converting to proper numeric types.
-        auto_commit: Whether to automatically commit the transaction (default: True)
+        clean_numeric_strings: If True (default), string values bound for numeric columns
+                              of the target table have commas and whitespace removed
+                              and are converted to numbers; other columns are inserted as is.
+        auto_commit: Whether to commit after the upsert (default: False). Outside an
+                    explicit transaction DuckDB already commits each statement; inside
+                    one, leave the commit to the caller so many records share one
+                    commit instead of one WAL flush each.
     
     Raises:
         DatabaseError: If validation fails or database operation encounters an error
@@ -159,9 +361,11 @@ def upsert_to_db(
         upsert_to_db(conn, {'user_id': 1, 'role_id': 2, 'active': True}, 
                      'user_roles', ['user_id', 'role_id'])
                      
-        # Without auto-commit (for batch operations)
-        upsert_to_db(conn, record, 'table', 'id', auto_commit=False)
-        conn.commit()  # Manual commit later
+        # Many records in one transaction (for batch operations)
+        conn.begin()
+        for record in records:
+            upsert_to_db(conn, record, 'table', 'id')
+        conn.commit()  # One commit for all records
     """
     # Input validation
     if not record:
@@ -170,10 +374,6 @@ def upsert_to_db(
     if not isinstance(record, dict):
         raise ValueError(f"Record must be a dictionary, got {type(record)}")
     
-    # Clean numeric strings if requested
-    if clean_numeric_strings:
-        record = clean_record_values(record)
-    
     # Validate table name
     validate_sql_identifier(table_name, "table name")
     
@@ -181,48 +381,20 @@ def upsert_to_db(
     for column_name in record.keys():
         validate_sql_identifier(column_name, "column name")
     
-    # Normalize conflict_key to list for consistent processing
-    if isinstance(conflict_key, str):
-        conflict_keys = [conflict_key]
-    elif isinstance(conflict_key, (list, tuple)):
-        conflict_keys = list(conflict_key)
-    else:
-        raise ValueError(f"conflict_key must be string, list, or tuple, got {type(conflict_key)}")
-    
-    if not conflict_keys:
-        raise ValueError("conflict_key cannot be empty")
-    
-    # Validate conflict keys
+    # Normalize and validate conflict keys
+    conflict_keys = _normalize_conflict_keys(conflict_key)
     for key in conflict_keys:
-        validate_sql_identifier(key, "conflict key")
         if key not in record:
             raise ValueError(f"Conflict key '{key}' not found in record")
     
     sql = None
     try:
-        # Build SQL components
-        columns = ', '.join(f'"{col}"' for col in record.keys())
-        placeholders = ', '.join(['?'] * len(record))
-        conflict_clause = ', '.join(f'"{key}"' for key in conflict_keys)
-        
-        # Create update clause (exclude conflict keys from updates)
-        update_columns = [col for col in record.keys() if col not in conflict_keys]
-        if update_columns:
-            update_clause = ', '.join(f'"{col}" = excluded."{col}"' for col in update_columns)
-            sql = f"""
-                INSERT INTO "{table_name}" ({columns}) 
-                VALUES ({placeholders})
-                ON CONFLICT({conflict_clause}) 
-                DO UPDATE SET {update_clause}
-            """
-        else:
-            # If all columns are conflict keys, just do INSERT ... ON CONFLICT DO NOTHING
-            sql = f"""
-                INSERT INTO "{table_name}" ({columns}) 
-                VALUES ({placeholders})
-                ON CONFLICT({conflict_clause}) 
-                DO NOTHING
-            """
+        # Clean numeric strings if requested; the column types are only looked up
+        # when the record has strings to clean
+        if clean_numeric_strings and any(isinstance(value, str) for value in record.values()):
+            record = _clean_numeric_columns(record, _numeric_column_types(conn, table_name))
+        
+        sql = _build_upsert_sql(table_name, tuple(record.keys()), conflict_keys)
         
         # Execute the query
         conn.execute(sql, list(record.values()))
@@ -234,40 +406,103 @@ def upsert_to_db(
         
     except Exception as e:
         logger.error(f"Failed to upsert record into {table_name}: {e}")
-        logger.debug(f"Record: {record}")
-        logger.debug(f"SQL: {sql if sql is not None else 'SQL not generated'}")
+        # Skip formatting the record and SQL unless they will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Record: {record}")
+            logger.debug(f"SQL: {sql if sql is not None else 'SQL not generated'}")
         raise DatabaseError(f"Database operation failed: {e}") from e
 
 
+def _upsert_staged_batch(conn, batch, columns, upsert_sql, stage_view) -> None:
+    """
+    Stage one batch under stage_view and run the prepared upsert over it.
+    
+    Args:
+        conn: DuckDB connection object
+        batch: List of record dictionaries
+        columns: Column names to stage, matching upsert_sql
+        upsert_sql: INSERT ... SELECT statement reading from stage_view
+        stage_view: View name the batch is registered under
+    """
+    staged, _ = _stage_records(batch, columns)
+    conn.register(stage_view, staged)
+    conn.execute(upsert_sql)
+
+
+def _upsert_batch_bisecting(conn, batch, columns, upsert_sql, stage_view) -> int:
+    """
+    Upsert a batch in autocommit mode, halving it on failure to isolate the bad record.
+    
+    Locating a failing record takes O(log n) statements instead of retrying every
+    record on its own.
+    
+    Args:
+        See _upsert_staged_batch.
+    
+    Returns:
+        Number of records upserted
+    
+    Raises:
+        DatabaseError: Once a single record fails on its own
+    """
+    try:
+        _upsert_staged_batch(conn, batch, columns, upsert_sql, stage_view)
+        return len(batch)
+    except DatabaseError:
+        raise  # Staging errors fail the same way for any half
+    except Exception as e:
+        if len(batch) == 1:
+            logger.error(f"Upsert failed for record {batch[0]}: {e}")
+            raise DatabaseError(f"Upsert failed for record {batch[0]}: {e}") from e
+        logger.debug(f"Batch of {len(batch)} records failed, retrying in halves: {e}")
+    
+    middle = len(batch) // 2
+    return (
+        _upsert_batch_bisecting(conn, batch[:middle], columns, upsert_sql, stage_view)
+        + _upsert_batch_bisecting(conn, batch[middle:], columns, upsert_sql, stage_view)
+    )
+
+
 # Convenience functions for batch operations
 def batch_upsert_to_db(
     conn,
     records: List[Dict[str, Any]],
     table_name: str,
     conflict_key: Union[str, List[str], Tuple[str, ...]] = 'id',
-    batch_size: int = 100,
-    clean_numeric_strings: bool = True
+    batch_size: Optional[int] = 100,
+    clean_numeric_strings: bool = True,
+    *,
+    auto_commit: bool = True
 ) -> int:
     """
-    High-performance batch upsert using temporary tables and SQL operations.
+    High-performance batch upsert using registered Arrow tables/DataFrames and SQL operations.
     
     This function performs batch upserts much more efficiently than individual
-    upsert operations by using temporary tables and bulk SQL operations.
+    upsert operations by staging each batch as a registered view and upserting
+    it with one SQL statement.
     
     Args:
         conn: DuckDB connection object
-        records: List of dictionaries to upsert
+        records: List of dictionaries to upsert (missing keys are inserted as NULL)
         table_name: Name of the target table
         conflict_key: Column name(s) to use for conflict resolution
-        batch_size: Number of records to process in each batch (default: 100)
-        clean_numeric_strings: If True (default), automatically clean numeric strings
-                              by removing commas and converting to proper numeric types.
+        batch_size: Number of records to process in each batch (default: 100).
+                   None stages all records at once and upserts them in a single statement.
+        clean_numeric_strings: If True (default), string values bound for numeric columns
+                              of the target table have commas and whitespace removed
+                              and are cast in SQL; other columns are inserted as is.
+        auto_commit: Whether to commit when done (default: True). A failed batch is then
+                    split in half and retried to isolate the failing record. Pass
+                    False when the caller manages the transaction; a failed batch is
+                    then raised as is, since DuckDB aborts the transaction on the
+                    first failed statement.
         
     Returns:
         Total number of records processed
         
     Raises:
-        DatabaseError: If any operation fails
+        DatabaseError: If any operation fails. Halves upserted before the failing
+                      record was isolated remain written when auto_commit is True.
         ValueError: If input parameters are invalid
         
     Example:
@@ -276,117 +511,79 @@ def batch_upsert_to_db(
         
         # Batch upsert with custom batch size
         count = batch_upsert_to_db(conn, records, "users", ["user_id", "role_id"], 200)
+        
+        # Single INSERT ... SELECT over all records
+        count = batch_upsert_to_db(conn, records, "users", "id", batch_size=None)
+        
+        # Inside a caller-managed transaction
+        conn.begin()
+        batch_upsert_to_db(conn, records, "users", "id", auto_commit=False)
+        conn.commit()
     """
     if not records:
         logger.debug("No records provided for batch upsert")
         return 0
     
-    # Import pandas here to avoid requiring it for simple upsert operations
-    try:
-        import pandas as pd
-    except ImportError as e:
-        raise DatabaseError("pandas is required for batch upsert operations") from e
+    if pa is None and pd is None:
+        raise DatabaseError("pyarrow or pandas is required for batch upsert operations")
     
     # Validate inputs using existing validation functions
     validate_sql_identifier(table_name, "table name")
+    conflict_keys = _normalize_conflict_keys(conflict_key)
     
-    # Normalize conflict_key to list for consistent processing
-    if isinstance(conflict_key, str):
-        conflict_keys = [conflict_key]
-    elif isinstance(conflict_key, (list, tuple)):
-        conflict_keys = list(conflict_key)
-    else:
-        raise ValueError(f"conflict_key must be string, list, or tuple, got {type(conflict_key)}")
-    
-    if not conflict_keys:
-        raise ValueError("conflict_key cannot be empty")
-    
-    # Validate conflict keys and record structure
+    # The column set and upsert SQL are fixed for all batches; records missing a
+    # column are staged with NULL for it
+    columns = _record_columns(records)
+    for column_name in columns:
+        validate_sql_identifier(column_name, "column name")
     for key in conflict_keys:
-        validate_sql_identifier(key, "conflict key")
+        if key not in records[0]:
+            raise ValueError(f"Conflict key '{key}' not found in records")
     
-    # Validate all column names in first record (assume consistent structure)
-    if records:
-        for column_name in records[0].keys():
-            validate_sql_identifier(column_name, "column name")
+    if batch_size is None:
+        batch_size = len(records)
     
     logger.debug(f"Starting batch upsert of {len(records)} records to {table_name} (batch_size={batch_size})")
     
     total_upserted = 0
     
-    # Clean numeric strings if requested
+    # Every batch is registered under the same view name; register() replaces the
+    # previous batch, so no per-batch DROP statements are needed
+    stage_view = f"_stage_{table_name}"
+    numeric_casts = ()
     if clean_numeric_strings:
-        records = [clean_record_values(record) for record in records]
+        numeric_casts = _numeric_string_casts(records, columns, _numeric_column_types(conn, table_name))
+    # ON CONFLICT updates matching rows in place (only the non-key columns in
+    # the records) rather than deleting and re-inserting them like INSERT OR REPLACE
+    upsert_sql = _build_upsert_sql(table_name, tuple(columns), conflict_keys, stage_view, numeric_casts)
     
-    # Process records in batches
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i + batch_size]
-        batch_num = i // batch_size + 1
-        
-        # Create a temporary DataFrame for this batch
-        df = pd.DataFrame(batch)
-        
-        # Create a unique temporary table name for this batch using timestamp
-        import time
-        timestamp = int(time.time() * 1000000)  # microseconds for uniqueness
-        temp_table = f"temp_{table_name}_{batch_num}_{timestamp}"
-        
-        try:
-            # Clean up any existing temp objects with the same name first
-            try:
-                conn.execute(f"DROP TABLE IF EXISTS {temp_table}")
-                conn.execute(f"DROP VIEW IF EXISTS {temp_table}")
-            except Exception:
-                pass  # Ignore cleanup errors
-            
-            # Insert batch into temporary table
-            conn.register(temp_table, df)
-            
-            # Build column list for the upsert
-            columns = list(df.columns)
-            column_list = ', '.join(f'"{col}"' for col in columns)
-            
-            # Use DuckDB's INSERT OR REPLACE syntax for upsert
-            # This is more efficient than ON CONFLICT for batch operations
-            upsert_sql = f"""
-            INSERT OR REPLACE INTO "{table_name}" ({column_list})
-            SELECT {column_list} FROM {temp_table}
-            """
-            
-            conn.execute(upsert_sql)
-            total_upserted += len(batch)
-            logger.debug(f"Successfully upserted batch {batch_num} ({len(batch)} records)")
-            
-            # Clean up temporary table
-            try:
-                conn.execute(f"DROP TABLE IF EXISTS {temp_table}")
-            except Exception:
-                # Try dropping as view if table drop fails
-                try:
-                    conn.execute(f"DROP VIEW IF EXISTS {temp_table}")
-                except Exception:
-                    pass  # Ignore final cleanup errors
+    try:
+        # Process records in batches
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            batch_num = i // batch_size + 1
             
-        except Exception as e:
-            logger.error(f"Batch upsert failed for batch {batch_num}: {e}")
-            # Fallback to individual inserts for this batch
-            logger.info(f"Falling back to individual inserts for batch {batch_num}")
-            for record in batch:
+            if auto_commit:
+                total_upserted += _upsert_batch_bisecting(conn, batch, columns, upsert_sql, stage_view)
+            else:
                 try:
-                    upsert_to_db(conn, record, table_name, conflict_key, auto_commit=False)
-                    total_upserted += 1
-                except Exception as individual_error:
-                    logger.error(f"Individual insert also failed: {individual_error}")
-            
-            # Clean up temporary objects if they exist (both table and view)
-            try:
-                conn.execute(f"DROP TABLE IF EXISTS {temp_table}")
-            except Exception:
-                pass
-            try:
-                conn.execute(f"DROP VIEW IF EXISTS {temp_table}")
-            except Exception:
-                pass
+                    _upsert_staged_batch(conn, batch, columns, upsert_sql, stage_view)
+                except Exception as e:
+                    # The caller's transaction is now aborted, so retrying parts of the batch cannot succeed
+                    logger.error(f"Batch upsert failed for batch {batch_num}: {e}")
+                    raise DatabaseError(f"Batch upsert failed for batch {batch_num}: {e}") from e
+                total_upserted += len(batch)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Successfully upserted batch {batch_num} ({len(batch)} records)")
+    finally:
+        try:
+            conn.unregister(stage_view)
+        except Exception:
+            pass  # Ignore cleanup errors
+    
+    if not auto_commit:
+        logger.debug(f"Batch upsert completed: {total_upserted} total records processed (commit deferred to caller)")
+        return total_upserted
     
     # Commit all changes at once
     try:
@@ -403,6 +600,245 @@ def batch_upsert_to_db(
     return total_upserted
 
 
+def bulk_upsert_to_db(
+    conn,
+    records: List[Dict[str, Any]],
+    table_name: str,
+    conflict_key: Optional[Union[str, List[str], Tuple[str, ...]]] = 'id',
+    clean_numeric_strings: bool = True,
+    *,
+    auto_commit: bool = True
+) -> int:
+    """
+    Upsert all records with a single INSERT ... SELECT ... ON CONFLICT statement.
+    
+    The records are staged as one Arrow table (or pandas DataFrame without pyarrow)
+    registered with DuckDB, so the whole set is written in one statement instead
+    of one statement per record or batch.
+    Non-key columns of existing rows are updated from the incoming records.
+    With conflict_key=None the records are appended with a plain INSERT.
+    
+    Args:
+        conn: DuckDB connection object
+        records: List of dictionaries to upsert (missing keys are inserted as NULL)
+        table_name: Name of the target table
+        conflict_key: Column name(s) to use for conflict resolution, or None to
+                     insert without conflict handling (see bulk_append)
+        clean_numeric_strings: If True (default), string values bound for numeric columns
+                              of the target table have commas and whitespace removed
+                              and are cast in SQL; other columns are inserted as is.
+        auto_commit: Whether to commit when done (default: True). Pass False when the
+                    caller manages the transaction.
+        
+    Returns:
+        Total number of records processed
+        
+    Raises:
+        DatabaseError: If preparing or executing the upsert fails
+        ValueError: If input parameters are invalid
+        
+    Example:
+        count = bulk_upsert_to_db(conn, records, "users", "id")
+        
+        # Inside a caller-managed transaction
+        conn.begin()
+        bulk_upsert_to_db(conn, records, "users", "id", auto_commit=False)
+        conn.commit()
+    """
+    if not records:
+        logger.debug("No records provided for bulk upsert")
+        return 0
+    
+    if pa is None and pd is None:
+        raise DatabaseError("pyarrow or pandas is required for bulk upsert operations")
+    
+    validate_sql_identifier(table_name, "table name")
+    conflict_keys = _normalize_conflict_keys(conflict_key) if conflict_key is not None else ()
+    
+    staged, columns = _stage_records(records)
+    for column_name in columns:
+        validate_sql_identifier(column_name, "column name")
+    for key in conflict_keys:
+        if key not in columns:
+            raise ValueError(f"Conflict key '{key}' not found in records")
+    
+    stage_view = f"_stage_{table_name}"
+    numeric_casts = ()
+    if clean_numeric_strings:
+        numeric_casts = _numeric_string_casts(records, columns, _numeric_column_types(conn, table_name))
+    sql = _build_upsert_sql(table_name, tuple(columns), conflict_keys, stage_view, numeric_casts)
+    
+    logger.debug(f"Starting bulk upsert of {len(records)} records to {table_name}")
+    try:
+        conn.register(stage_view, staged)
+        try:
+            conn.execute(sql)
+        finally:
+            conn.unregister(stage_view)
+        
+        if auto_commit:
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Failed to bulk upsert records into {table_name}: {e}")
+        logger.debug(f"SQL: {sql}")
+        raise DatabaseError(f"Bulk upsert failed: {e}") from e
+    
+    logger.debug(f"Bulk upsert completed: {len(records)} total records processed")
+    return len(records)
+
+
+def bulk_append(
+    conn,
+    records: List[Dict[str, Any]],
+    table_name: str,
+    clean_numeric_strings: bool = True,
+    *,
+    auto_commit: bool = True
+) -> int:
+    """
+    Append records to a table with a single INSERT ... SELECT, without conflict handling.
+    
+    For pure inserts this skips the ON CONFLICT index probe. With pyarrow installed
+    no pandas DataFrame is built; DuckDB's own conn.append() only accepts DataFrames.
+    
+    Args:
+        conn: DuckDB connection object
+        records: List of dictionaries to insert (missing keys are inserted as NULL)
+        table_name: Name of the target table
+        clean_numeric_strings: If True (default), clean numeric strings bound for
+                              numeric columns as in bulk_upsert_to_db.
+        auto_commit: Whether to commit when done (default: True)
+        
+    Returns:
+        Total number of records processed
+        
+    Raises:
+        DatabaseError: If preparing or executing the insert fails (including
+                      primary key violations)
+        
+    Example:
+        count = bulk_append(conn, log_records, "download_log")
+    """
+    return bulk_upsert_to_db(conn, records, table_name, None, clean_numeric_strings,
+                             auto_commit=auto_commit)
+
+
+class PreparedUpsert:
+    """
+    Upsert statement prepared once for records sharing a table and column layout.
+    
+    DuckDB's Python API does not expose standalone prepared statement handles, so
+    this holds the validated, cached upsert SQL. executemany() binds it once and
+    runs it for every row, avoiding a parse and bind per record. Nothing is
+    committed; the caller manages the transaction.
+    
+    Create instances with prepare_upsert().
+    """
+    
+    def __init__(self, conn, table_name: str, columns: Tuple[str, ...],
+                 conflict_keys: Tuple[str, ...], clean_numeric_strings: bool = True):
+        self.conn = conn
+        self.table_name = table_name
+        self.columns = columns
+        self.clean_numeric_strings = clean_numeric_strings
+        # Numeric target columns, looked up once; only their string values are cleaned
+        self.numeric_columns = (
+            frozenset(_numeric_column_types(conn, table_name)).intersection(columns)
+            if clean_numeric_strings else frozenset()
+        )
+        self.sql = _build_upsert_sql(table_name, columns, conflict_keys)
+    
+    def _values(self, record: Dict[str, Any]) -> List[Any]:
+        """Record values in column order (missing columns become NULL)."""
+        if self.numeric_columns:
+            record = _clean_numeric_columns(record, self.numeric_columns)
+        return [record.get(col) for col in self.columns]
+    
+    def execute(self, record: Dict[str, Any]) -> None:
+        """
+        Upsert a single record.
+        
+        Raises:
+            DatabaseError: If the database operation fails
+        """
+        try:
+            self.conn.execute(self.sql, self._values(record))
+        except Exception as e:
+            logger.error(f"Failed to upsert record into {self.table_name}: {e}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Record: {record}")
+            raise DatabaseError(f"Database operation failed: {e}") from e
+    
+    def executemany(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Upsert many records with a single prepared statement.
+        
+        Returns:
+            Number of records processed
+        
+        Raises:
+            DatabaseError: If the database operation fails
+        """
+        if not records:
+            return 0
+        try:
+            self.conn.executemany(self.sql, [self._values(record) for record in records])
+        except Exception as e:
+            logger.error(f"Failed to upsert {len(records)} records into {self.table_name}: {e}")
+            raise DatabaseError(f"Database operation failed: {e}") from e
+        return len(records)
+
+
+def prepare_upsert(
+    conn,
+    table_name: str,
+    columns: Union[List[str], Tuple[str, ...]],
+    conflict_key: Union[str, List[str], Tuple[str, ...]] = 'id',
+    clean_numeric_strings: bool = True
+) -> PreparedUpsert:
+    """
+    Validate a table/column layout once and return a reusable upsert for it.
+    
+    Args:
+        conn: DuckDB connection object
+        table_name: Name of the target table
+        columns: Column names every record is written with, in order
+        conflict_key: Column name(s) to use for conflict resolution
+        clean_numeric_strings: If True (default), string values bound for numeric columns
+                              of the target table are cleaned as in upsert_to_db.
+    
+    Returns:
+        PreparedUpsert bound to conn
+    
+    Raises:
+        DatabaseError: If an identifier is invalid
+        ValueError: If input parameters are invalid
+    
+    Example:
+        upsert = prepare_upsert(conn, "users", ["id", "name"], "id")
+        conn.begin()
+        for record in records:
+            upsert.execute(record)
+        conn.commit()
+        
+        # Or one prepared statement over all rows
+        upsert.executemany(records)
+    """
+    validate_sql_identifier(table_name, "table name")
+    columns = tuple(columns)
+    if not columns:
+        raise ValueError("columns cannot be empty")
+    for column_name in columns:
+        validate_sql_identifier(column_name, "column name")
+    
+    conflict_keys = _normalize_conflict_keys(conflict_key)
+    for key in conflict_keys:
+        if key not in columns:
+            raise ValueError(f"Conflict key '{key}' not found in columns")
+    
+    return PreparedUpsert(conn, table_name, columns, conflict_keys, clean_numeric_strings)
+
+
 def get_module_info() -> Dict[str, Union[str, List[str]]]:
     """
     Get module information for debugging and version tracking.
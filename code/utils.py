@@ -1,5 +1,8 @@
 from datetime import datetime, timezone, timedelta
 
+# EST is UTC-5 (UTC-4 during daylight saving time, but we'll use standard EST)
+EST = timezone(timedelta(hours=-5))
+
 def get_standard_timestamp():
     """
     Get a standardized timestamp string in EST with seconds precision.
@@ -12,6 +15,4 @@ def get_standard_timestamp():
         >>> get_standard_timestamp()
         '2025-07-13 14:30:45-05:00'
     """
-    # EST is UTC-5 (UTC-4 during daylight saving time, but we'll use standard EST)
-    est_timezone = timezone(timedelta(hours=-5))
-    return datetime.now(est_timezone).isoformat(sep=" ", timespec="seconds")
+    return datetime.now(EST).isoformat(sep=" ", timespec="seconds")